@@ -1,16 +1,27 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 import asyncio
 import json
 import logging
-from datetime import datetime
+import os
+import time
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
 from app.db.session import get_db
-from app.db.models import Patient, Movement, Alert, MovementSeverity
+from app.db.models import Patient, Movement, Alert, Clip, MovementSeverity
 from app.motion_detection.detector import MotionDetector
+from app.motion_detection.replay import ReplayJobs, has_replay_results
 from app.schemas.movement import MovementCreate
+from app.schemas.replay import ReplayRequest, ReplayJob
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.schemas.user import UserResponse
 from app.services.alert_service import AlertService
+from app.services.clip_service import (
+    ClipRecorder, load_clip_index, CLIP_RECORDING, CLIP_SAVED, CLIP_FAILED
+)
 
 router = APIRouter()
 
@@ -18,11 +29,226 @@ router = APIRouter()
 connections = {}
 # Store motion detectors for each patient
 motion_detectors = {}
+# Store clip recorders (recent frame buffers) for each connection, so
+# concurrent streams for one patient never mix frames or cut each other's clips
+clip_recorders = {}
+# Multipart boundary used when streaming saved clips
+CLIP_STREAM_BOUNDARY = "clipframe"
+# Background replay jobs (one in flight at a time)
+replay_jobs = ReplayJobs()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def resolve_under_root(root: str, path: str) -> str:
+    """Resolve a client-supplied relative path, refusing anything outside root"""
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.isabs(path) or os.path.commonpath([root, resolved]) != root:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid path: {path}"
+        )
+    return resolved
+
+@router.post("/replay", response_model=ReplayJob, status_code=status.HTTP_202_ACCEPTED)
+def replay_recordings(
+    replay_in: ReplayRequest,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Start re-running motion detection over recorded footage without touching live movements or alerts"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to run replays"
+        )
+    
+    sources = [resolve_under_root(settings.RECORDINGS_DIR, source) for source in replay_in.sources]
+    output_dir = resolve_under_root(settings.REPLAY_RESULTS_DIR, replay_in.output_dir)
+    # Each run needs its own directory so earlier results are never overwritten
+    if output_dir == os.path.realpath(settings.REPLAY_RESULTS_DIR):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Output directory must be a subdirectory of the results root"
+        )
+    if has_replay_results(output_dir):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Output directory already contains replay results: {replay_in.output_dir}"
+        )
+    
+    missing = [name for name, source in zip(replay_in.sources, sources) if not os.path.exists(source)]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Recording not found: {', '.join(missing)}"
+        )
+    
+    job = replay_jobs.submit(
+        replay_in.output_dir,
+        sources=sources,
+        output_dir=output_dir,
+        sensitivity=replay_in.sensitivity,
+        min_area=replay_in.min_area,
+        patient_status=replay_in.patient_status.value,
+        fps=replay_in.fps,
+        workers=min(replay_in.workers or settings.REPLAY_MAX_WORKERS, settings.REPLAY_MAX_WORKERS)
+    )
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A replay is already running"
+        )
+    return job
+
+@router.get("/replay/{job_id}", response_model=ReplayJob)
+def get_replay_job(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get the status and results of a replay job"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view replays"
+        )
+    
+    job = replay_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Replay job not found"
+        )
+    return job
+
+def get_alert_clip_record(alert_id: int, db: Session, current_user: UserResponse) -> Clip:
+    """Look up the clip linked to an alert, checking the user may see it"""
+    alert = db.query(Alert).filter(Alert.id == alert_id).first()
+    if not alert:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Alert not found"
+        )
+    
+    # Check if user has access to this alert
+    if current_user.role != "admin" and alert.recipient_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this alert"
+        )
+    
+    clip = db.query(Clip).filter(Clip.movement_id == alert.movement_id).first()
+    if not clip:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No clip recorded for this alert"
+        )
+    return clip
+
+def get_saved_clip_index(clip: Clip) -> Dict:
+    """Load a clip's frame index, or fail with the reason the clip is unavailable"""
+    index = load_clip_index(clip.file_path)
+    
+    # The "recording" marker is written on the clip writer thread and can lag
+    # the Clip row, so a recent clip without an index is still in progress
+    if index is None and clip.timestamp and datetime.utcnow() - clip.timestamp < timedelta(
+        seconds=(clip.pre_seconds or 0) + (clip.post_seconds or 0)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Clip is still being recorded"
+        )
+    
+    if index is None or (index["status"] == CLIP_SAVED and not os.path.exists(clip.file_path)):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Clip file is missing"
+        )
+    
+    # The clip is written once its post-event window has passed
+    if index["status"] == CLIP_RECORDING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Clip is still being recorded"
+        )
+    
+    if index["status"] == CLIP_FAILED:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Clip could not be saved"
+        )
+    return index
+
+@router.get("/alerts/{alert_id}/clip")
+def get_alert_clip(
+    alert_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """
+    Stream the clip recorded around a critical movement alert.
+
+    Served as multipart/x-mixed-replace, paced by the recorded frame times,
+    so browsers can play it directly in an <img> element.
+    """
+    clip = get_alert_clip_record(alert_id, db, current_user)
+    index = get_saved_clip_index(clip)
+    file_path = clip.file_path
+    
+    def stream_frames():
+        previous_offset = 0.0
+        with open(file_path, "rb") as f:
+            for frame in index["frames"]:
+                time.sleep(max(0.0, frame["offset"] - previous_offset))
+                previous_offset = frame["offset"]
+                f.seek(frame["position"])
+                data = f.read(frame["size"])
+                yield (
+                    b"--" + CLIP_STREAM_BOUNDARY.encode() + b"\r\n"
+                    b"Content-Type: image/jpeg\r\n"
+                    b"Content-Length: " + str(len(data)).encode() + b"\r\n\r\n"
+                    + data + b"\r\n"
+                )
+    
+    return StreamingResponse(
+        stream_frames(),
+        media_type=f"multipart/x-mixed-replace; boundary={CLIP_STREAM_BOUNDARY}"
+    )
+
+@router.get("/alerts/{alert_id}/clip/index")
+def get_alert_clip_index(
+    alert_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get frame timings for an alert's clip and where the alert's movement falls in it"""
+    clip = get_alert_clip_record(alert_id, db, current_user)
+    index = get_saved_clip_index(clip)
+    return {**index, "event_offset": clip.event_offset}
+
+@router.get("/alerts/{alert_id}/clip/frames/{frame_number}")
+def get_alert_clip_frame(
+    alert_id: int,
+    frame_number: int,
+    db: Session = Depends(get_db),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get a single JPEG frame from an alert's clip, for step-through playback"""
+    clip = get_alert_clip_record(alert_id, db, current_user)
+    index = get_saved_clip_index(clip)
+    if frame_number < 0 or frame_number >= len(index["frames"]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Frame not found"
+        )
+    
+    frame = index["frames"][frame_number]
+    with open(clip.file_path, "rb") as f:
+        f.seek(frame["position"])
+        data = f.read(frame["size"])
+    return Response(content=data, media_type="image/jpeg")
+
 @router.websocket("/ws/{patient_id}")
 async def websocket_endpoint(
     websocket: WebSocket, 
@@ -45,6 +271,7 @@ async def websocket_endpoint(
     # Initialize motion detector with patient's sensitivity level
     if patient_id not in motion_detectors:
         motion_detectors[patient_id] = MotionDetector(sensitivity=patient.sensitivity_level)
+    clip_recorders[connection_id] = ClipRecorder(patient_id)
     
     # Alert service for sending notifications
     alert_service = AlertService(db)
@@ -65,6 +292,9 @@ async def websocket_endpoint(
             # Detect motion
             motion_detected, movements, processed_frame = motion_detectors[patient_id].detect_motion(frame)
             
+            # Critical movements get a clip once this frame is buffered
+            critical_movement_ids = []
+            
             # If motion detected, store in database and check for alerts
             if motion_detected and movements:
                 for movement_data in movements:
@@ -88,6 +318,9 @@ async def websocket_endpoint(
                     db.commit()
                     db.refresh(db_movement)
                     
+                    if severity == MovementSeverity.CRITICAL:
+                        critical_movement_ids.append(db_movement.id)
+                    
                     # Check if alert should be created
                     if severity in [MovementSeverity.ATTENTION, MovementSeverity.CRITICAL]:
                         await alert_service.create_movement_alert(
@@ -101,6 +334,23 @@ async def websocket_endpoint(
             _, buffer = cv2.imencode('.jpg', processed_frame)
             processed_data = buffer.tobytes()
             
+            # Keep the encoded frame for pre/post-event clips
+            clip_recorder = clip_recorders[connection_id]
+            frame_time = time.time()
+            clip_recorder.add_frame(processed_data, timestamp=frame_time)
+            if critical_movement_ids:
+                clip_path, event_offset = clip_recorder.start_clip(timestamp=frame_time)
+                for movement_id in critical_movement_ids:
+                    db.add(Clip(
+                        patient_id=patient_id,
+                        movement_id=movement_id,
+                        file_path=clip_path,
+                        event_offset=event_offset,
+                        pre_seconds=clip_recorder.pre_seconds,
+                        post_seconds=clip_recorder.post_seconds
+                    ))
+                db.commit()
+            
             # Send processed frame and movement data back to client
             await websocket.send_bytes(processed_data)
             await websocket.send_json({
@@ -119,8 +369,11 @@ async def websocket_endpoint(
         # Remove connection
         if connection_id in connections:
             del connections[connection_id]
+        # Save whatever has been captured of an in-progress clip
+        clip_recorders.pop(connection_id).flush()
         logger.info(f"Client disconnected: {connection_id}")
     except Exception as e:
         logger.error(f"Error in WebSocket: {e}")
         if connection_id in connections:
-            del connections[connection_id]
\ No newline at end of file
+            del connections[connection_id]
+        clip_recorders.pop(connection_id).flush()
\ No newline at end of file
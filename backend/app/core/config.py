@@ -0,0 +1,27 @@
+import os
+from pydantic import BaseSettings, validator
+from typing import List
+
+# backend/ directory, used to anchor default storage paths
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Settings(BaseSettings):
+    CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:5173"]
+    
+    # Replay (offline re-analysis) storage; API requests may only name paths under these roots
+    RECORDINGS_DIR: str = os.path.join(BASE_DIR, "data", "recordings")
+    REPLAY_RESULTS_DIR: str = os.path.join(BASE_DIR, "data", "replay_results")
+    # Worker processes for an API replay; leaves cores free for live monitoring
+    REPLAY_MAX_WORKERS: int = max(1, (os.cpu_count() or 2) // 2)
+    
+    # Pre/post-event clips for critical movements
+    CLIP_STORAGE_DIR: str = os.path.join(BASE_DIR, "data", "clips")
+    
+    @validator("RECORDINGS_DIR", "REPLAY_RESULTS_DIR", "CLIP_STORAGE_DIR")
+    def make_absolute(cls, value: str) -> str:
+        # Stored paths must not depend on the working directory a worker starts in
+        return os.path.abspath(value)
+
+
+settings = Settings()
@@ -63,6 +63,7 @@ class Movement(Base):
     severity = Column(Enum(MovementSeverity), default=MovementSeverity.NORMAL)
     
     patient = relationship("Patient", back_populates="movements")
+    clip = relationship("Clip", back_populates="movement", uselist=False)
 
 class Alert(Base):
     __tablename__ = "alerts"
@@ -70,7 +71,7 @@ class Alert(Base):
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id"))
     recipient_id = Column(Integer, ForeignKey("users.id"))
-    movement_id = Column(Integer, ForeignKey("movements.id"), nullable=True)
+    movement_id = Column(Integer, ForeignKey("movements.id"), nullable=True, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
     message = Column(Text)
     severity = Column(Enum(MovementSeverity))
@@ -78,4 +79,18 @@ class Alert(Base):
     acknowledged_timestamp = Column(DateTime, nullable=True)
     
     patient = relationship("Patient", back_populates="alerts")
-    recipient = relationship("User", back_populates="alerts")
\ No newline at end of file
+    recipient = relationship("User", back_populates="alerts")
+
+class Clip(Base):
+    __tablename__ = "clips"
+
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"))
+    movement_id = Column(Integer, ForeignKey("movements.id"), unique=True, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    file_path = Column(String)  # Motion JPEG file, written asynchronously after the event
+    event_offset = Column(Float)  # Seconds from the start of the clip to this movement
+    pre_seconds = Column(Float)
+    post_seconds = Column(Float)
+    
+    movement = relationship("Movement", back_populates="clip")
@@ -42,16 +42,24 @@ class MotionDetector:
             logger.error(f"Failed to load pose estimation model: {e}")
             self.pose_model = None
             
-    def detect_motion(self, frame) -> Tuple[bool, List[Dict], np.ndarray]:
+    def detect_motion(self, frame, timestamp: Optional[float] = None) -> Tuple[bool, List[Dict], np.ndarray]:
         """
         Detect motion in the frame
         
+        Args:
+            frame: BGR frame to analyze
+            timestamp: Capture time of the frame in seconds. Defaults to the
+                current wall-clock time; replay passes the recorded frame time
+                so durations are measured in stream time, not processing time.
+        
         Returns:
             Tuple containing:
             - Boolean indicating if motion was detected
             - List of detected movements with details
             - Processed frame with visualizations
         """
+        current_time = time.time() if timestamp is None else timestamp
+        
         # Convert frame to grayscale for processing
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         gray = cv2.GaussianBlur(gray, (21, 21), 0)
@@ -92,7 +100,6 @@ class MotionDetector:
             intensity = cv2.contourArea(contour) / (frame.shape[0] * frame.shape[1]) * 100
             
             # Track movement duration
-            current_time = time.time()
             movement_id = f"{body_part}_{x}_{y}"
             
             if movement_id not in self.current_movements:
@@ -127,7 +134,6 @@ class MotionDetector:
             )
             
         # Clean up old movements (not seen for more than 2 seconds)
-        current_time = time.time()
         movements_to_remove = []
         for movement_id, movement_data in self.current_movements.items():
             if current_time - movement_data["last_seen"] > 2.0:
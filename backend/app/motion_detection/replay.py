@@ -0,0 +1,393 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.db.models import MovementSeverity, PatientStatus
+from app.motion_detection.detector import MotionDetector
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg")
+DEFAULT_FPS = 10.0
+# Matches the detector's own cleanup window: a movement not seen for this long has ended
+EPISODE_GAP_SECONDS = 2.0
+RESULT_FILES = ("episodes.jsonl", "alerts.jsonl", "summary.json")
+
+SEVERITY_RANK = {
+    MovementSeverity.NORMAL: 0,
+    MovementSeverity.ATTENTION: 1,
+    MovementSeverity.CRITICAL: 2,
+}
+
+
+def natural_sort_key(name: str) -> List:
+    """Sort key that orders embedded numbers numerically, so frame_2 precedes frame_10"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def iter_frames(source: str, fps: float = DEFAULT_FPS) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Yield (timestamp, frame) pairs from a recorded video file or a directory of JPEGs.
+
+    Timestamps are seconds from the start of the recording. Video files use the
+    container's own frame times; JPEG directories are read in natural filename
+    order (numbers compared numerically, so names need no zero padding) and
+    spaced at the given frame rate.
+    """
+    if os.path.isdir(source):
+        filenames = sorted(
+            (name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS)),
+            key=natural_sort_key
+        )
+        for index, name in enumerate(filenames):
+            frame = cv2.imread(os.path.join(source, name), cv2.IMREAD_COLOR)
+            if frame is None:
+                logger.warning(f"Skipping unreadable image: {name}")
+                continue
+            yield index / fps, frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Unable to open recording: {source}")
+
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or fps
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            position_ms = capture.get(cv2.CAP_PROP_POS_MSEC)
+            yield (position_ms / 1000.0 if position_ms > 0 else index / video_fps), frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def replay_source(
+    source: str,
+    sensitivity: float = 1.0,
+    min_area: int = 500,
+    patient_status: str = "stable",
+    fps: float = DEFAULT_FPS
+) -> Dict:
+    """
+    Run one recording through a fresh MotionDetector.
+
+    Background subtraction and duration tracking are stateful, so frames within a
+    recording are processed in order; parallelism comes from replaying several
+    recordings at once.
+
+    Returns a dict with the movement episodes and the alerts the live pipeline
+    would have raised.
+    """
+    detector = MotionDetector(sensitivity=sensitivity, min_area=min_area)
+    # Open episodes keyed by body part; the detector's own movement ids change
+    # whenever the bounding box shifts, so they are too fine-grained to group on
+    open_episodes: Dict[str, Dict] = {}
+    episodes: List[Dict] = []
+    alerts: List[Dict] = []
+    frame_count = 0
+    started = time.perf_counter()
+
+    def close_episode(body_part: str):
+        episode = open_episodes.pop(body_part)
+        episode["duration"] = episode["end_time"] - episode["start_time"]
+        episodes.append(episode)
+
+    for timestamp, frame in iter_frames(source, fps):
+        frame_count += 1
+        motion_detected, movements, _ = detector.detect_motion(frame, timestamp=timestamp)
+
+        # Close episodes that have gone quiet before this frame can extend them
+        for body_part in [
+            body_part for body_part, episode in open_episodes.items()
+            if timestamp - episode["end_time"] > EPISODE_GAP_SECONDS
+        ]:
+            close_episode(body_part)
+
+        for movement_data in movements:
+            severity = detector.analyze_movement_severity(movement_data, patient_status)
+            body_part = movement_data["body_part"]
+
+            episode = open_episodes.get(body_part)
+            if episode is None:
+                episode = open_episodes[body_part] = {
+                    "source": source,
+                    "body_part": body_part,
+                    "start_time": timestamp,
+                    "end_time": timestamp,
+                    "frames": 0,
+                    "detections": 0,
+                    "max_intensity": 0.0,
+                    # Longest duration the live detector reported, as used for severity
+                    "detector_duration": 0.0,
+                    "severity": MovementSeverity.NORMAL,
+                }
+            # Several contours can map to the same body part in one frame
+            if episode["end_time"] != timestamp or episode["frames"] == 0:
+                episode["frames"] += 1
+            episode["end_time"] = timestamp
+            episode["detections"] += 1
+            episode["max_intensity"] = max(episode["max_intensity"], movement_data["intensity"])
+            episode["detector_duration"] = max(episode["detector_duration"], movement_data["duration"])
+            if SEVERITY_RANK[severity] > SEVERITY_RANK[episode["severity"]]:
+                episode["severity"] = severity
+
+            # Same rule and message as the live WebSocket loop
+            if severity in [MovementSeverity.ATTENTION, MovementSeverity.CRITICAL]:
+                alerts.append({
+                    "source": source,
+                    "timestamp": timestamp,
+                    "body_part": body_part,
+                    "severity": severity.value,
+                    "message": f"{severity.value.title()} movement detected: {body_part} moved for {movement_data['duration']:.1f} seconds with intensity {movement_data['intensity']:.1f}%"
+                })
+
+    for body_part in list(open_episodes):
+        close_episode(body_part)
+
+    for episode in episodes:
+        episode["severity"] = episode["severity"].value
+    episodes.sort(key=lambda episode: episode["start_time"])
+
+    return {
+        "source": source,
+        "frames": frame_count,
+        "processing_seconds": time.perf_counter() - started,
+        "episodes": episodes,
+        "alerts": alerts,
+    }
+
+
+def has_replay_results(output_dir: str) -> bool:
+    """Whether a directory already holds the output of an earlier replay"""
+    return any(os.path.exists(os.path.join(output_dir, name)) for name in RESULT_FILES)
+
+
+class ReplayResultStore:
+    """
+    Writes replay output to its own directory, kept apart from the live
+    movements and alerts tables so tuning runs never page anyone.
+    """
+    def __init__(self, output_dir: str):
+        if has_replay_results(output_dir):
+            raise ValueError(f"Output directory already contains replay results: {output_dir}")
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def save(self, parameters: Dict, results: List[Dict]) -> Dict:
+        """Persist a replay run and return its summary"""
+        summary = {
+            "created_at": datetime.utcnow().isoformat(),
+            "parameters": parameters,
+            "sources": [
+                {
+                    "source": result["source"],
+                    "frames": result["frames"],
+                    "processing_seconds": result["processing_seconds"],
+                    "episodes": len(result["episodes"]),
+                    "alerts": len(result["alerts"]),
+                    "error": result.get("error"),
+                } for result in results
+            ],
+            "failed_sources": sum(1 for result in results if result.get("error")),
+            "total_frames": sum(result["frames"] for result in results),
+            "total_episodes": sum(len(result["episodes"]) for result in results),
+            "total_alerts": sum(len(result["alerts"]) for result in results),
+        }
+
+        with open(os.path.join(self.output_dir, "episodes.jsonl"), "w") as f:
+            for result in results:
+                for episode in result["episodes"]:
+                    f.write(json.dumps(episode) + "\n")
+
+        with open(os.path.join(self.output_dir, "alerts.jsonl"), "w") as f:
+            for result in results:
+                for alert in result["alerts"]:
+                    f.write(json.dumps(alert) + "\n")
+
+        with open(os.path.join(self.output_dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+
+        return summary
+
+
+def run_replay(
+    sources: List[str],
+    output_dir: str,
+    sensitivity: float = 1.0,
+    min_area: int = 500,
+    patient_status: str = "stable",
+    fps: float = DEFAULT_FPS,
+    workers: Optional[int] = None
+) -> Dict:
+    """
+    Replay recordings through the detector in parallel and store the results.
+
+    Each recording is handled by its own worker process, so throughput scales
+    with the number of recordings up to the number of workers. A single
+    recording always runs on one core: the detector's background model and
+    duration tracking depend on every earlier frame, so one file cannot be
+    split across workers without changing its results.
+    """
+    parameters = {
+        "sensitivity": sensitivity,
+        "min_area": min_area,
+        "patient_status": patient_status,
+        "fps": fps,
+    }
+    started = time.perf_counter()
+
+    if fps <= 0 or sensitivity <= 0:
+        raise ValueError("fps and sensitivity must be greater than 0")
+    if min_area < 0:
+        raise ValueError("min_area must not be negative")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1")
+
+    if has_replay_results(output_dir):
+        raise ValueError(f"Output directory already contains replay results: {output_dir}")
+
+    workers = min(workers or os.cpu_count() or 1, len(sources)) or 1
+    # Spawn rather than fork: API replays start from a thread inside the running
+    # server, and forking a multi-threaded process can deadlock the children
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(replay_source, source, sensitivity, min_area, patient_status, fps)
+            for source in sources
+        ]
+        results = []
+        # A recording that fails is reported in the summary without losing the others
+        for source, future in zip(sources, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Replay of {source} failed: {e}")
+                results.append({
+                    "source": source,
+                    "frames": 0,
+                    "processing_seconds": 0.0,
+                    "episodes": [],
+                    "alerts": [],
+                    "error": str(e),
+                })
+
+    summary = ReplayResultStore(output_dir).save(parameters, results)
+    summary["wall_seconds"] = time.perf_counter() - started
+    logger.info(
+        f"Replayed {summary['total_frames']} frames from {len(sources)} recording(s) "
+        f"in {summary['wall_seconds']:.1f}s: {summary['total_episodes']} episodes, "
+        f"{summary['total_alerts']} would-be alerts, {summary['failed_sources']} failed recording(s)"
+    )
+    return summary
+
+
+class ReplayJobs:
+    """
+    Runs API-submitted replays in the background, one at a time.
+
+    Only a single replay may be in flight, so at most one worker pool exists
+    and live monitoring keeps the remaining cores.
+    """
+    def __init__(self):
+        self.jobs: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="replay")
+
+    def submit(self, output_name: str, **replay_kwargs) -> Optional[Dict]:
+        """Start a replay job, or return None if one is already running"""
+        with self.lock:
+            if any(job["status"] == "running" for job in self.jobs.values()):
+                return None
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "status": "running",
+                "output_dir": output_name,
+                "summary": None,
+                "error": None,
+            }
+            self.jobs[job["job_id"]] = job
+
+        self.executor.submit(self._run, job, replay_kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    def _run(self, job: Dict, replay_kwargs: Dict):
+        try:
+            job["summary"] = run_replay(**replay_kwargs)
+            job["status"] = "completed"
+        except Exception as e:
+            logger.error(f"Replay job {job['job_id']} failed: {e}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+
+
+def _positive_float(value: str) -> float:
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0: {value}")
+    return number
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
+
+
+def _non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return number
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Replay recorded footage through the motion detector for offline analysis",
+        epilog="Recordings are processed in parallel, one per worker process. Each recording "
+               "runs on a single core, so splitting long footage into several files is the "
+               "way to use more cores."
+    )
+    parser.add_argument("sources", nargs="+", help="Video files or directories of JPEG frames")
+    parser.add_argument("--output", required=True, help="Directory to write replay results to")
+    parser.add_argument("--sensitivity", type=_positive_float, default=1.0, help="Movement sensitivity multiplier")
+    parser.add_argument("--min-area", type=_non_negative_int, default=500, help="Minimum contour area in pixels")
+    parser.add_argument("--status", default="stable", choices=[s.value for s in PatientStatus], help="Patient status used for severity thresholds")
+    parser.add_argument("--fps", type=_positive_float, default=DEFAULT_FPS, help="Frame rate for JPEG directories")
+    parser.add_argument("--workers", type=_positive_int, default=None, help="Number of worker processes (one recording per worker)")
+    args = parser.parse_args(argv)
+
+    summary = run_replay(
+        sources=args.sources,
+        output_dir=args.output,
+        sensitivity=args.sensitivity,
+        min_area=args.min_area,
+        patient_status=args.status,
+        fps=args.fps,
+        workers=args.workers
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
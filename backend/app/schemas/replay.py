@@ -0,0 +1,42 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.db.models import PatientStatus
+
+
+class ReplayRequest(BaseModel):
+    sources: List[str] = Field(..., min_items=1)  # Video files or JPEG directories, relative to RECORDINGS_DIR
+    output_dir: str  # Relative to REPLAY_RESULTS_DIR
+    sensitivity: float = Field(1.0, gt=0)
+    min_area: int = Field(500, ge=0)
+    patient_status: PatientStatus = PatientStatus.STABLE
+    fps: float = Field(10.0, gt=0)  # Frame rate assumed for JPEG directories
+    workers: Optional[int] = Field(None, ge=1)
+
+
+class ReplaySourceSummary(BaseModel):
+    source: str
+    frames: int
+    processing_seconds: float
+    episodes: int
+    alerts: int
+    error: Optional[str] = None  # Set when this recording could not be replayed
+
+
+class ReplaySummary(BaseModel):
+    created_at: str
+    parameters: dict
+    sources: List[ReplaySourceSummary]
+    failed_sources: int
+    total_frames: int
+    total_episodes: int
+    total_alerts: int
+    wall_seconds: float
+
+
+class ReplayJob(BaseModel):
+    job_id: str
+    status: str  # running, completed, failed
+    output_dir: str  # Relative to REPLAY_RESULTS_DIR
+    summary: Optional[ReplaySummary] = None
+    error: Optional[str] = None
@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRE_SECONDS = 10.0
+DEFAULT_POST_SECONDS = 10.0
+# Per-stream budget, applied separately to the ring buffer and to the clip being
+# captured, so one stream holds at most about twice this much
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# Global cap on frames waiting for the writer thread, across all streams
+MAX_PENDING_WRITE_BYTES = 128 * 1024 * 1024
+
+# Clip states recorded in the index file
+CLIP_RECORDING = "recording"
+CLIP_SAVED = "saved"
+CLIP_FAILED = "failed"
+
+# Shared by all recorders so disk writes never run on the frame loop. A single
+# thread keeps each clip's "recording" marker ordered before its final index.
+_clip_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-writer")
+_pending_lock = threading.Lock()
+_pending_write_bytes = 0
+
+
+def clip_index_path(file_path: str) -> str:
+    """Path of the JSON index written next to a clip"""
+    return file_path + ".json"
+
+
+def load_clip_index(file_path: str) -> Optional[Dict]:
+    """Read a clip's index, or None if it is missing"""
+    try:
+        with open(clip_index_path(file_path)) as f:
+            return json.load(f)
+    except OSError:
+        return None
+
+
+def _save_clip_index(file_path: str, index: Dict):
+    tmp_index_path = clip_index_path(file_path) + ".part"
+    with open(tmp_index_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_index_path, clip_index_path(file_path))
+
+
+def _mark_clip_recording(file_path: str):
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # The pid lets a restarted server tell abandoned captures from live ones
+        _save_clip_index(file_path, {"status": CLIP_RECORDING, "pid": os.getpid()})
+    except Exception as e:
+        logger.error(f"Failed to mark clip {file_path} as recording: {e}")
+
+
+def _mark_clip_failed(file_path: str, error: str):
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        _save_clip_index(file_path, {"status": CLIP_FAILED, "error": error})
+    except Exception as e:
+        logger.error(f"Failed to mark clip {file_path} as failed: {e}")
+
+
+def _write_pending_clip(file_path: str, frames: List[Tuple[float, bytes]], event_times: List[float], size: int):
+    """Write a queued clip, then release its share of the pending-write budget"""
+    global _pending_write_bytes
+    try:
+        _write_clip(file_path, frames, event_times)
+    finally:
+        with _pending_lock:
+            _pending_write_bytes -= size
+
+
+def _write_clip(file_path: str, frames: List[Tuple[float, bytes]], event_times: List[float]):
+    """
+    Write frames back-to-back as a Motion JPEG file, plus a JSON index.
+
+    Frames arrive at whatever rate the client sends them, so the index keeps
+    each frame's time offset and byte range along with the event offsets;
+    players and the frame endpoint use it to place frames in time.
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        start_time = frames[0][0] if frames else (event_times[0] if event_times else 0.0)
+        index = {
+            "status": CLIP_SAVED,
+            "start_time": start_time,
+            "end_time": frames[-1][0] if frames else start_time,
+            "frame_count": len(frames),
+            "event_offsets": [event_time - start_time for event_time in event_times],
+            "frames": [],
+        }
+
+        tmp_path = file_path + ".part"
+        position = 0
+        with open(tmp_path, "wb") as f:
+            for timestamp, jpeg in frames:
+                f.write(jpeg)
+                index["frames"].append({
+                    "offset": timestamp - start_time,
+                    "position": position,
+                    "size": len(jpeg),
+                })
+                position += len(jpeg)
+        # Readers only ever see complete clips
+        os.replace(tmp_path, file_path)
+
+        _save_clip_index(file_path, index)
+        logger.info(f"Saved clip {file_path} ({len(frames)} frames)")
+    except Exception as e:
+        logger.error(f"Failed to write clip {file_path}: {e}")
+        # Record the failure so readers can tell it apart from a clip still recording
+        _mark_clip_failed(file_path, str(e))
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def fail_interrupted_clips(clip_dir: Optional[str] = None) -> int:
+    """
+    Mark clips left "recording" by a process that no longer exists as failed.
+
+    Run at startup so captures cut short by a restart do not report
+    "still being recorded" forever. Returns the number of clips marked.
+    """
+    clip_dir = os.path.abspath(clip_dir or settings.CLIP_STORAGE_DIR)
+    if not os.path.isdir(clip_dir):
+        return 0
+
+    marked = 0
+    for name in os.listdir(clip_dir):
+        if not name.endswith(".mjpeg.json"):
+            continue
+        file_path = os.path.join(clip_dir, name[:-len(".json")])
+        index = load_clip_index(file_path)
+        if index and index.get("status") == CLIP_RECORDING and not _process_alive(index.get("pid")):
+            _mark_clip_failed(file_path, "Recording interrupted by a server restart")
+            marked += 1
+
+    if marked:
+        logger.info(f"Marked {marked} interrupted clip(s) as failed")
+    return marked
+
+
+class FrameRingBuffer:
+    """
+    Holds the most recent encoded frames, bounded by both age and total bytes.
+    """
+    def __init__(self, max_seconds: float, max_bytes: int):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.frames: Deque[Tuple[float, bytes]] = deque()
+        self.total_bytes = 0
+
+    def append(self, timestamp: float, jpeg: bytes):
+        self.frames.append((timestamp, jpeg))
+        self.total_bytes += len(jpeg)
+
+        # Evict oldest frames once over budget or out of the window
+        while self.frames and (
+            self.total_bytes > self.max_bytes
+            or timestamp - self.frames[0][0] > self.max_seconds
+        ):
+            _, evicted = self.frames.popleft()
+            self.total_bytes -= len(evicted)
+
+    def snapshot(self) -> List[Tuple[float, bytes]]:
+        return list(self.frames)
+
+
+class ClipRecorder:
+    """
+    Keeps one stream's recent frames in memory and saves pre/post-event clips.
+
+    Frames are the JPEG bytes already encoded for the WebSocket reply, so
+    buffering costs no extra encoding. When an event starts a clip, the
+    buffered frames are kept and following frames are appended until the
+    post-event window ends; the file is then written on a background thread.
+    """
+    def __init__(
+        self,
+        patient_id: int,
+        clip_dir: Optional[str] = None,
+        pre_seconds: float = DEFAULT_PRE_SECONDS,
+        post_seconds: float = DEFAULT_POST_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.patient_id = patient_id
+        self.clip_dir = os.path.abspath(clip_dir or settings.CLIP_STORAGE_DIR)
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_bytes = max_bytes
+        self.buffer = FrameRingBuffer(pre_seconds, max_bytes)
+        # Clip currently collecting post-event frames
+        self.capture_path: Optional[str] = None
+        self.capture_start: float = 0.0
+        self.capture_end: float = 0.0
+        self.capture_events: List[float] = []
+        self.capture_frames: List[Tuple[float, bytes]] = []
+        self.capture_bytes = 0
+
+    def add_frame(self, jpeg: bytes, timestamp: Optional[float] = None):
+        """Buffer an encoded frame and feed any clip being captured"""
+        timestamp = time.time() if timestamp is None else timestamp
+        self.buffer.append(timestamp, jpeg)
+
+        if self.capture_path is None:
+            return
+
+        if timestamp > self.capture_end or self.capture_bytes + len(jpeg) > self.max_bytes:
+            self.flush()
+            return
+
+        self.capture_frames.append((timestamp, jpeg))
+        self.capture_bytes += len(jpeg)
+
+    def start_clip(self, timestamp: Optional[float] = None) -> Tuple[str, float]:
+        """
+        Start capturing a clip around an event.
+
+        Returns the file path the clip will be saved to and the event's offset
+        in seconds from the start of the clip.
+
+        Events that arrive while a clip is already being captured share that clip,
+        and push its end back so each event gets its full post-event window
+        (the byte budget still caps the clip's total size).
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.capture_path is not None:
+            self.capture_end = max(self.capture_end, timestamp + self.post_seconds)
+            self.capture_events.append(timestamp)
+            return self.capture_path, timestamp - self.capture_start
+
+        self.capture_path = os.path.join(
+            self.clip_dir,
+            f"patient_{self.patient_id}_{int(timestamp * 1000)}_{uuid.uuid4().hex[:8]}.mjpeg"
+        )
+        self.capture_frames = self.buffer.snapshot()
+        self.capture_bytes = sum(len(jpeg) for _, jpeg in self.capture_frames)
+        self.capture_start = self.capture_frames[0][0] if self.capture_frames else timestamp
+        self.capture_end = timestamp + self.post_seconds
+        self.capture_events = [timestamp]
+        _clip_writer.submit(_mark_clip_recording, self.capture_path)
+        return self.capture_path, timestamp - self.capture_start
+
+    def flush(self):
+        """
+        Hand the clip being captured to the background writer.
+
+        If the writer is already holding MAX_PENDING_WRITE_BYTES of frames
+        (slow disk, many simultaneous events), the clip is dropped and marked
+        failed rather than letting queued frames grow without bound.
+        """
+        global _pending_write_bytes
+        if self.capture_path is None:
+            return
+
+        size = self.capture_bytes
+        with _pending_lock:
+            accepted = _pending_write_bytes + size <= MAX_PENDING_WRITE_BYTES
+            if accepted:
+                _pending_write_bytes += size
+
+        if accepted:
+            _clip_writer.submit(
+                _write_pending_clip, self.capture_path, self.capture_frames, self.capture_events, size
+            )
+        else:
+            logger.error(f"Dropping clip {self.capture_path}: clip writer backlog is full")
+            _clip_writer.submit(_mark_clip_failed, self.capture_path, "Clip writer backlog full")
+
+        self.capture_path = None
+        self.capture_frames = []
+        self.capture_events = []
+        self.capture_bytes = 0
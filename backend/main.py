@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.api.api_v1.api import api_router
 from app.core.config import settings
 from app.db.session import init_db
+from app.services.clip_service import fail_interrupted_clips
 
 app = FastAPI(
     title="Patient Monitoring System",
@@ -25,6 +26,7 @@ app.include_router(api_router, prefix="/api/v1")
 @app.on_event("startup")
 async def startup_event():
     await init_db()
+    fail_interrupted_clips()
 
 @app.get("/")
 async def root():